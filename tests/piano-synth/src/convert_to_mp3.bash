@@ -10,10 +10,26 @@ if ! command -v ffmpeg &> /dev/null; then
     exit 1
 fi
 
+# Convert only the WAV files given as arguments, or every WAV file if none are given
+if [ "$#" -gt 0 ]; then
+    wav_files=("$@")
+else
+    wav_files=(*.wav)
+fi
+
+# Number of ffmpeg processes to run at once (defaults to the number of cores)
+max_jobs="${CONVERT_JOBS:-$(nproc 2>/dev/null || echo 4)}"
+
 echo "Converting WAV files to MP3..."
 
-# Loop through all .wav files in the current directory
-for wav_file in *.wav; do
+# PIDs of running conversions, oldest first, and whether any conversion failed.
+# Waiting on each PID (rather than 'wait -n', which needs bash 4.3+) keeps this
+# working with macOS's /bin/bash 3.2 and keeps ffmpeg's exit status.
+pids=()
+failed=0
+
+# Loop through the selected .wav files
+for wav_file in "${wav_files[@]}"; do
     # Check if file exists to handle case where no .wav files are found
     if [ -e "$wav_file" ]; then
         # Get filename without extension
@@ -21,12 +37,28 @@ for wav_file in *.wav; do
 
         echo "Converting: $wav_file -> $filename.mp3"
 
-        # Convert using ffmpeg
+        # Convert using ffmpeg, in the background so files are converted in parallel
         # -y: Overwrite output files
         # -codec:a libmp3lame: Use LAME encoder
         # -qscale:a 2: Variable bit rate (High quality, roughly 190kbps)
-        ffmpeg -hide_banner -loglevel error -y -i "$wav_file" -codec:a libmp3lame -qscale:a 2 "$filename.mp3" < /dev/null
+        ffmpeg -hide_banner -loglevel error -y -i "$wav_file" -codec:a libmp3lame -qscale:a 2 "$filename.mp3" < /dev/null &
+        pids+=("$!")
+
+        # Wait for the oldest conversion to free a slot before starting the next one
+        if [ "${#pids[@]}" -ge "$max_jobs" ]; then
+            wait "${pids[0]}" || failed=1
+            pids=("${pids[@]:1}")
+        fi
     fi
 done
 
+for pid in "${pids[@]}"; do
+    wait "$pid" || failed=1
+done
+
+if [ "$failed" -ne 0 ]; then
+    echo "Error: one or more conversions failed."
+    exit 1
+fi
+
 echo "All conversions complete!"
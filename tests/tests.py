@@ -10,27 +10,57 @@
 # The source of truth for the scores and the frames needs to be generated
 # along with the music in the Rust component in order for it to make sense.
 
-import json
-import math
+import functools
 import os
+import pickle
+import shutil
 import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import NamedTuple
+
+import numpy as np
+
+# orjson parses the test list faster, but is optional
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    import json
+    _loads = json.loads
 
 AVAILABLE_TESTS_JSON = "piano-synth/available_tests.json"
 TOLERANCE = 0.05
 STATE_BOUNDARY_TOLERANCE = 3
 
+# Paths are resolved relative to this script, once at import
+_SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+# Audio files are in piano-synth/target_music/
+_AUDIO_DIR = os.path.join(_SCRIPT_DIR, "piano-synth", "target_music")
+_CONVERT_SCRIPT = os.path.join(_SCRIPT_DIR, "piano-synth", "src", "convert_to_mp3.bash")
+
+# Equal-tempered frequency of each MIDI note, and the geometric midpoints between
+# neighbouring notes, so the nearest note can be found with a binary search
+_MIDI_FREQS = 440.0 * 2.0 ** ((np.arange(129, dtype=np.float64) - 69) / 12.0)
+_MIDI_BOUNDARIES = np.sqrt(_MIDI_FREQS[:-1] * _MIDI_FREQS[1:])
+
+# Number of worker processes used to run score tests. Tests run serially unless
+# this is set to more than 1; parallel runs need an algo that can be pickled.
+JOBS_ENV_VAR = "PIANO_TEST_JOBS"
+
 # Use the hardcoded JSON file to see what tests are available.
-# Returns a list of test case dictionaries
+# Returns a list of test case dictionaries. The file is only read once per
+# session, so callers must not modify the returned list.
+@functools.lru_cache(maxsize=1)
 def get_available_tests():
-    # Resolve path relative to this script
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    json_path = os.path.join(script_dir, AVAILABLE_TESTS_JSON)
+    json_path = os.path.join(_SCRIPT_DIR, AVAILABLE_TESTS_JSON)
 
     if not os.path.exists(json_path):
         raise FileNotFoundError(f"Could not find test configuration at {json_path}")
 
-    with open(json_path, 'r') as f:
-        return json.load(f)
+    with open(json_path, 'rb') as f:
+        return _loads(f.read())
 
 def extract_note_arrays(test_case):
     """
@@ -44,18 +74,13 @@ def extract_note_arrays(test_case):
     note_names = []
 
     for track in tracks:
-        track_freqs = []
-        track_durs = []
-        track_names = []
-        for note in track:
-            freq = note.get('frequency', 0.0)
-            if freq > 0:
-                midi_note = int(round(69 + 12 * math.log2(freq / 440.0)))
-            else:
-                midi_note = 0
-            track_freqs.append(midi_note)
-            track_durs.append(note.get('duration', 0.0))
-            track_names.append(note.get('name', ''))
+        # Convert the whole track to MIDI at once; non-positive frequencies are rests
+        freqs = np.fromiter((note.get('frequency', 0.0) for note in track),
+                            dtype=np.float64, count=len(track))
+        midi = np.searchsorted(_MIDI_BOUNDARIES, freqs).astype(np.int32)
+        track_freqs = np.where(freqs > 0, midi, 0).tolist()
+        track_durs = [note.get('duration', 0.0) for note in track]
+        track_names = [note.get('name', '') for note in track]
 
         frequencies.append(track_freqs)
         durations.append(track_durs)
@@ -63,6 +88,35 @@ def extract_note_arrays(test_case):
 
     return frequencies, durations, note_names
 
+def _gt_frames(durs, sample_rate, hop_length):
+    """
+    Rasterizes note durations (in seconds) into frames.
+    Returns (state_frames, boundary_frames) as int32 / int64 arrays.
+    """
+    # Frame index at which each note ends; each note starts where the previous one ended
+    ends = np.floor((np.cumsum(durs) * sample_rate) / hop_length).astype(np.int64)
+    boundary_frames = np.empty(len(durs) + 1, dtype=np.int64)
+    boundary_frames[0] = 0
+    boundary_frames[1:] = ends
+    starts = boundary_frames[:-1]
+
+    # Fill state frames
+    counts = np.maximum(ends - starts, 0)
+    state_frames = np.repeat(np.arange(len(durs), dtype=np.int32), counts)
+
+    # Add final boundary
+    boundary_frames[-1] = len(state_frames)
+
+    return state_frames, boundary_frames
+
+# Ground truth per (durations, sample_rate, hop_length), reused across test runs.
+# Keyed on the durations themselves so edited or reloaded test cases are never stale.
+@functools.lru_cache(maxsize=128)
+def _cached_gt_frames(durs, sample_rate, hop_length):
+    state_frames, boundary_frames = _gt_frames(np.asarray(durs, dtype=np.float64),
+                                               sample_rate, hop_length)
+    return state_frames.tolist(), boundary_frames.tolist()
+
 def get_note_separation_ground_truth(test_case, sample_rate=22050, hop_length=512):
     """
     Generates ground truth for note separation.
@@ -71,6 +125,7 @@ def get_note_separation_ground_truth(test_case, sample_rate=22050, hop_length=51
     Returns:
         state_frames: List of state indices for each frame.
         boundary_frames: List of frame indices where notes change.
+    Results are cached, so callers must not modify them.
     """
     _, durations, _ = extract_note_arrays(test_case)
 
@@ -78,29 +133,140 @@ def get_note_separation_ground_truth(test_case, sample_rate=22050, hop_length=51
         return [], []
 
     # Use first track
-    track_durs = durations[0]
+    return _cached_gt_frames(tuple(durations[0]), sample_rate, hop_length)
 
-    state_frames = []
-    boundary_frames = []
+def mp3_name(filename):
+    """
+    Returns the name of the mp3 generated from a test's .wav filename.
+    """
+    return filename[:-4] + ".mp3" if filename.endswith(".wav") else filename
 
-    current_time = 0.0
+def convert_missing_audio(audio_dir, filenames):
+    """
+    Runs the conversion script once for every test file that does not have an
+    mp3 in audio_dir yet, converting them in parallel.
+    Returns True if all of the files are available afterwards.
+    """
+    def missing_files():
+        # One directory listing instead of a stat call per file
+        try:
+            present = {entry.name for entry in os.scandir(audio_dir)}
+        except FileNotFoundError:
+            present = set()
+        return [f for f in dict.fromkeys(filenames) if mp3_name(f) not in present]
 
-    for i, dur in enumerate(track_durs):
-        start_frame = int((current_time * sample_rate) / hop_length)
-        boundary_frames.append(start_frame)
+    missing = missing_files()
+    if not missing:
+        return True
 
-        current_time += dur
-        end_frame = int((current_time * sample_rate) / hop_length)
+    print(f"Missing audio files. Attempting to run conversion script...")
 
-        # Fill state frames
-        current_frame_count = len(state_frames)
-        if end_frame > current_frame_count:
-            state_frames.extend([i] * (end_frame - current_frame_count))
+    # Fail fast rather than spawning the script just to find ffmpeg missing
+    if shutil.which("ffmpeg") is None:
+        print("ERROR: Audio conversion failed. Ensure ffmpeg is installed.")
+        return False
 
-    # Add final boundary
-    boundary_frames.append(len(state_frames))
+    try:
+        subprocess.check_call(["bash", _CONVERT_SCRIPT, *missing])
+    except subprocess.CalledProcessError:
+        print("ERROR: Audio conversion failed.")
+        return False
 
-    return state_frames, boundary_frames
+    missing = missing_files()
+    if missing:
+        print(f"ERROR: Files {', '.join(missing)} still not found after conversion attempts.")
+        return False
+
+    return True
+
+class Score(NamedTuple):
+    """
+    Pitch and tempo accuracy produced by a score test algo, each in [0.0, 1.0].
+    """
+    pitch_accuracy: float
+    tempo_accuracy: float
+
+    @classmethod
+    def from_result(cls, result):
+        """
+        Normalizes an algo result into a Score. Accepts a Score, a dict with keys
+        'pitch_accuracy' and 'tempo_accuracy', or a tuple (pitch_accuracy, tempo_accuracy).
+        """
+        if isinstance(result, cls):
+            return result
+        if isinstance(result, dict):
+            return cls(result.get('pitch_accuracy', 0.0), result.get('tempo_accuracy', 0.0))
+        if isinstance(result, (tuple, list)) and len(result) >= 2:
+            return cls(result[0], result[1])
+        return cls(0.0, 0.0)
+
+def get_worker_count():
+    """
+    Returns the number of worker processes to use, from the PIANO_TEST_JOBS
+    environment variable if set, otherwise 1 (run serially).
+    """
+    jobs = os.environ.get(JOBS_ENV_VAR)
+    if not jobs:
+        return 1
+    try:
+        return max(1, int(jobs))
+    except ValueError:
+        print(f"WARNING: Invalid {JOBS_ENV_VAR} value {jobs!r}, running tests serially.")
+        return 1
+
+def _run_score_test(job):
+    """
+    Runs a single score test in a worker process.
+    Returns (score, error) where error is the exception message, if any.
+    """
+    algo, ideal_filepath, filepath = job
+    try:
+        return Score.from_result(algo(ideal_filepath, filepath)), None
+    except Exception as e:
+        return None, str(e)
+
+def _check_worker_algo(algo):
+    """
+    Does nothing; loading the algo in a worker process is the check.
+    """
+    return True
+
+def _start_worker_pool(algo, workers):
+    """
+    Starts a pool of worker processes for the score tests.
+    Returns None, meaning run serially, if the algo cannot be sent to the workers
+    (e.g. a lambda, or a notebook function under spawn).
+    """
+    ex = ProcessPoolExecutor(max_workers=workers)
+    try:
+        # Send the algo on its own first, so a failure here never loses a test
+        ex.submit(_check_worker_algo, algo).result()
+    except (pickle.PicklingError, AttributeError, BrokenProcessPool) as e:
+        ex.shutdown()
+        print(f"WARNING: Could not run tests in parallel ({e}), running serially instead.")
+        return None
+    return ex
+
+def _iter_score_outcomes(jobs, ex):
+    """
+    Yields (score, error) for each job, in order, as soon as it is available.
+    Jobs run in the calling process if ex is None, otherwise on its workers.
+    """
+    if ex is None:
+        for job in jobs:
+            yield _run_score_test(job)
+        return
+
+    try:
+        futures = [ex.submit(_run_score_test, job) for job in jobs]
+        for future in futures:
+            try:
+                yield future.result()
+            except BrokenProcessPool as e:
+                # A worker died (e.g. crashed or was killed); don't rerun the test here
+                yield None, f"Worker process terminated ({e})"
+    finally:
+        ex.shutdown(cancel_futures=True)
 
 def run_score_tests(algo):
     """
@@ -108,13 +274,11 @@ def run_score_tests(algo):
 
     algo: A function that takes parameters (ideal_filepath, test_filepath) and
           returns a result containing pitch and tempo accuracy.
-          Expected return format: dict with keys 'pitch_accuracy', 'tempo_accuracy'
-          OR a tuple (pitch_accuracy, tempo_accuracy).
+          Expected return format: a Score, a dict with keys 'pitch_accuracy',
+          'tempo_accuracy' OR a tuple (pitch_accuracy, tempo_accuracy).
     """
     tests = get_available_tests()
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    # Audio files are in piano-synth/target_music/
-    audio_dir = os.path.join(script_dir, "piano-synth", "target_music")
+    audio_dir = _AUDIO_DIR
 
     passed_count = 0
     total_count = len(tests)
@@ -122,99 +286,86 @@ def run_score_tests(algo):
 
     print(f"Starting execution of {total_count} tests...")
 
-    for test in tests:
-        filename = test['filename']
-        ideal_filename = test['ideal_filename']
-        expected_pitch = test['expected_pitch_accuracy']
-        expected_tempo = test['expected_tempo_accuracy']
-
-        filename = filename.replace(".wav", ".mp3")
-        ideal_filename = ideal_filename.replace(".wav", ".mp3")
-
-        filepath = os.path.join(audio_dir, filename)
-        ideal_filepath = os.path.join(audio_dir, ideal_filename)
-
-        if not os.path.exists(filepath) or not os.path.exists(ideal_filepath):
-            print(f"Missing audio files. Attempting to run conversion script...")
-            convert_script = os.path.join(script_dir, "piano-synth", "src", "convert_to_mp3.bash")
-
+    # Convert every missing file up front in a single run of the conversion script
+    if not convert_missing_audio(audio_dir, [f for test in tests for f in (test['filename'], test['ideal_filename'])]):
+        return
+
+    # Resolve names, paths and expected scores once, up front
+    cases = [(mp3_name(test['filename']), mp3_name(test['ideal_filename']),
+              test['expected_pitch_accuracy'], test['expected_tempo_accuracy']) for test in tests]
+    jobs = [(algo, os.path.join(audio_dir, ideal_filename), os.path.join(audio_dir, filename))
+            for filename, ideal_filename, _, _ in cases]
+
+    # Tests are independent, so they can be run across processes; reports are
+    # still printed in order, as each test finishes
+    workers = min(get_worker_count(), max(1, len(jobs)))
+    ex = _start_worker_pool(algo, workers) if workers > 1 else None
+    outcomes = _iter_score_outcomes(jobs, ex)
+
+    for filename, _, expected_pitch, expected_tempo in cases:
+        lines = [f"Testing {filename}..."]
+        if ex is None:
+            # Running in this process: show which test is running before it starts
+            sys.stdout.write(lines.pop() + "\n")
+            sys.stdout.flush()
+
+        score, error = next(outcomes)
+        if error is not None:
+            lines.append(f"  ERROR: Exception during test execution: {error}")
+        else:
             try:
-                subprocess.check_call(["bash", convert_script])
-            except subprocess.CalledProcessError:
-                print("ERROR: Audio conversion failed. Ensure ffmpeg is installed.")
-                return
-
-            if not os.path.exists(filepath) or not os.path.exists(ideal_filepath):
-                print(f"ERROR: Files {filename} or {ideal_filename} still not found after conversion attempts.")
-                return
-
-        try:
-            print(f"Testing {filename}...")
-            result = algo(ideal_filepath, filepath)
-
-            # Normalize result
-            actual_pitch = 0.0
-            actual_tempo = 0.0
-
-            if isinstance(result, dict):
-                actual_pitch = result.get('pitch_accuracy', 0.0)
-                actual_tempo = result.get('tempo_accuracy', 0.0)
-            elif isinstance(result, (tuple, list)) and len(result) >= 2:
-                actual_pitch = result[0]
-                actual_tempo = result[1]
-
-            # Verify accuracy
-            pitch_pass = abs(actual_pitch - expected_pitch) <= TOLERANCE
-            tempo_pass = abs(actual_tempo - expected_tempo) <= TOLERANCE
-
-            if pitch_pass and tempo_pass:
-                print("  PASS")
-                passed_count += 1
-            else:
-                print("  FAIL")
-                if not pitch_pass:
-                    print(f"    Pitch Accuracy: Expected {expected_pitch}, Got {actual_pitch}")
-                if not tempo_pass:
-                    print(f"    Tempo Accuracy: Expected {expected_tempo}, Got {actual_tempo}")
-
-        except Exception as e:
-            print(f"  ERROR: Exception during test execution: {e}")
+                actual_pitch = score.pitch_accuracy
+                actual_tempo = score.tempo_accuracy
+
+                # Verify accuracy
+                pitch_pass = abs(actual_pitch - expected_pitch) <= TOLERANCE
+                tempo_pass = abs(actual_tempo - expected_tempo) <= TOLERANCE
+
+                if pitch_pass and tempo_pass:
+                    lines.append("  PASS")
+                    passed_count += 1
+                else:
+                    lines.append("  FAIL")
+                    if not pitch_pass:
+                        lines.append(f"    Pitch Accuracy: Expected {expected_pitch}, Got {actual_pitch}")
+                    if not tempo_pass:
+                        lines.append(f"    Tempo Accuracy: Expected {expected_tempo}, Got {actual_tempo}")
+
+            except Exception as e:
+                lines.append(f"  ERROR: Exception during test execution: {e}")
+
+        # Write each test's report in one call
+        sys.stdout.write("\n".join(lines) + "\n")
+        sys.stdout.flush()
 
     print(f"Test Suite Completed: {passed_count}/{total_count} passed.")
 
+# Older name for run_score_tests, still used in the README and notebooks
+run_all_tests = run_score_tests
+
 def run_note_seperation_tests(algo, sr=22050, hop_length=512):
     """
     Runs note separation tests.
     algo: A function that takes (filepath, frequencies, durations) and returns (state_frames, boundary_frames).
     """
     tests = get_available_tests()
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    audio_dir = os.path.join(script_dir, "piano-synth", "target_music")
+    audio_dir = _AUDIO_DIR
 
     print(f"Starting execution of {len(tests)} note separation tests...")
 
+    if not convert_missing_audio(audio_dir, [test['filename'] for test in tests]):
+        return
+
     for test in tests:
-        filename = test['filename']
-        filename = filename.replace(".wav", ".mp3")
+        filename = mp3_name(test['filename'])
         filepath = os.path.join(audio_dir, filename)
 
-        if not os.path.exists(filepath):
-            print(f"Missing audio files. Attempting to run conversion script...")
-            convert_script = os.path.join(script_dir, "piano-synth", "src", "convert_to_mp3.bash")
-
-            try:
-                subprocess.check_call(["bash", convert_script])
-            except subprocess.CalledProcessError:
-                print("ERROR: Audio conversion failed. Ensure ffmpeg is installed.")
-                return
-
-            if not os.path.exists(filepath):
-                print(f"ERROR: File {filename} still not found after conversion attempts.")
-                return
+        # Show which test is running before the algo starts
+        sys.stdout.write(f"Testing {filename}...\n")
+        sys.stdout.flush()
 
+        lines = []
         try:
-            print(f"Testing {filename}...")
-
             # Get Ground Truth
             frequencies, durations, _ = extract_note_arrays(test)
             gt_states, gt_boundaries = get_note_separation_ground_truth(test, sr, hop_length)
@@ -227,7 +378,12 @@ def run_note_seperation_tests(algo, sr=22050, hop_length=512):
             matches = 0
             if gt_states:
                 min_len = min(len(gt_states), len(actual_states))
-                matches = sum(1 for i in range(min_len) if gt_states[i] == actual_states[i])
+                gt_arr = np.asarray(gt_states[:min_len])
+                act_arr = np.asarray(actual_states[:min_len])
+                if act_arr.dtype.kind not in "biuf":
+                    # Non-numeric states are compared element by element, like plain ==
+                    act_arr = np.asarray(actual_states[:min_len], dtype=object)
+                matches = int(np.count_nonzero(gt_arr == act_arr))
                 state_acc = matches / len(gt_states)
             else:
                 state_acc = 1.0 if not actual_states else 0.0
@@ -235,17 +391,27 @@ def run_note_seperation_tests(algo, sr=22050, hop_length=512):
             # Compare Boundaries (Recall with tolerance of 3 frames)
             matched_boundaries = 0
             if gt_boundaries:
-                for gt_b in gt_boundaries:
-                    if any(abs(gt_b - act_b) <= STATE_BOUNDARY_TOLERANCE for act_b in actual_boundaries):
-                        matched_boundaries += 1
+                if len(actual_boundaries):
+                    # Nearest actual boundary on either side of each ground truth boundary
+                    act = np.sort(np.asarray(actual_boundaries, dtype=np.float64))
+                    gt = np.asarray(gt_boundaries, dtype=np.float64)
+                    idx = np.searchsorted(act, gt)
+                    left = np.clip(idx - 1, 0, len(act) - 1)
+                    right = np.clip(idx, 0, len(act) - 1)
+                    dist = np.minimum(np.abs(act[left] - gt), np.abs(act[right] - gt))
+                    matched_boundaries = int((dist <= STATE_BOUNDARY_TOLERANCE).sum())
                 boundary_recall = matched_boundaries / len(gt_boundaries)
             else:
                 boundary_recall = 1.0 if not actual_boundaries else 0.0
 
-            print(f"  State Accuracy: {state_acc:.2%}")
-            print(f"  Boundary Recall: {boundary_recall:.2%} (Found {len(actual_boundaries)}/{len(gt_boundaries)})")
+            lines.append(f"  State Accuracy: {state_acc:.2%}")
+            lines.append(f"  Boundary Recall: {boundary_recall:.2%} (Found {len(actual_boundaries)}/{len(gt_boundaries)})")
 
         except Exception as e:
-            print(f"  ERROR: Exception during test execution: {e}")
+            lines.append(f"  ERROR: Exception during test execution: {e}")
+
+        # Write each test's report in one call
+        sys.stdout.write("\n".join(lines) + "\n")
+        sys.stdout.flush()
 
     print("Note Separation Tests Completed.")